@@ -5,6 +5,7 @@
 # Strings, integers, lists and dictionaries.
 # Exemple of a bencoded value: d4:name4:spam4:info12:length4:1234e .
 
+import mmap
 from collections import OrderedDict
 from typing import Union, List, Dict
 
@@ -23,19 +24,44 @@ TOKEN_END = b'e'
 # Delimits string length from string data
 TOKEN_STRING_SEPARATOR = b':'
 
+# Integer values of the tokens above, as returned when indexing the data
+_INTEGER = ord(TOKEN_INTEGER)
+_LIST = ord(TOKEN_LIST)
+_DICT = ord(TOKEN_DICT)
+_END = ord(TOKEN_END)
+_STRING_SEPARATOR = ord(TOKEN_STRING_SEPARATOR)
+
+# Lookup table marking the byte values ('0' - '9') which starts a string,
+# i.e. the digits of its length prefix
+_IS_DIGIT = bytes((1 if 48 <= i <= 57 else 0) for i in range(256))
+
 
 class Decoder:
     """
         Class to manage a bencoded sequence of bytes
     """
     def __init__(self, data: bytes):
-        if not isinstance(data, bytes):
+        if not isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
             raise TypeError(
                 "Argument 'data' must be of type 'bytes'")
-        self._data = data
+        # A memoryview allows slicing the data without copying it, only
+        # the leaf values (strings) are copied out of the buffer. A memory
+        # map is used as is, since a view would prevent closing the map.
+        if isinstance(data, mmap.mmap):
+            self._data = data
+        else:
+            self._data = memoryview(data)
+        # The raw data is kept to search for tokens using the C
+        # implemented 'find' instead of looping over each byte.
+        self._raw = bytes(data) if isinstance(data, memoryview) else data
+        self._len = len(data)
         self._index = 0
+        # The nesting level of the dict being decoded
+        self._depth = 0
+        # The (start, end) offsets of the value of the 'info' key in the
+        # top-level dict, if any. The SHA1 of these bytes is the info hash.
+        self.info_span = None
 
-    @staticmethod
     def decode_data(self):
         """
             Decodes the bencoded data and return matching
@@ -44,116 +70,186 @@ class Decoder:
             Params:
                 return: A python object representing the bencoded data.
         """
-        c = self._peek()
-
-        is_none = c is None
-        is_int = c == TOKEN_INTEGER
-        is_list = c == TOKEN_LIST
-        is_dict = c == TOKEN_DICT
-        is_end = c == TOKEN_END
-        is_string = c in b'01234567899'
-
-        if is_none:
+        index = self._index
+        if index >= self._len:
             raise EOFError('Unexpected end-of-file')
-        elif is_int:
-            self._consume()
-            return self._decode_int()
-        elif is_list:
-            self._consume()
-            return self._decode_list()
-        elif is_dict:
-            self._consume()
-            return self._decode_dict()
-        elif is_end:
-            self._consume()
-            return None
-        elif is_string:
+        c = self._data[index]
+
+        # Strings (including every dict key) are the most common values,
+        # so these are checked for before looking up the other tokens.
+        if _IS_DIGIT[c]:
             return self._decode_string()
-        else:
-            raise RuntimeError(f'Invalid token read at {str(self._index)}')
+        handler = _DISPATCH.get(c)
+        if handler:
+            self._index = index + 1
+            return handler(self)
+        raise RuntimeError(f'Invalid token read at {str(self._index)}')
 
-    def _peek(self):
+    def _at_end_token(self) -> bool:
         """
-            Return the next character from the bencodede data or None.
+            Checks if the next byte is the END token of a list or dict, the
+            data must not end before it.
         """
-        if self._index + 1 >= len(self._data):
-            return None
-        return self._data[self._index:self._index + 1]
+        if self._index >= self._len:
+            raise EOFError('Unexpected end-of-file')
+        return self._data[self._index] == _END
 
     def _consume(self):
-        ...
-
-    def _read(self):
-        ...
+        """
+            Read (and therefore consume) the next character from the data.
+        """
+        self._index += 1
 
-    def _read_until(self):
-        ...
+    def _read(self, length: int) -> memoryview:
+        """
+            Read the 'length' number of bytes from data and return the
+            result as a view over the data (or as bytes for a memory map).
+        """
+        if self._index + length > self._len:
+            raise IndexError(
+                f'Cannot read {str(length)} bytes from position '
+                f'{str(self._index)}')
+        res = self._data[self._index:self._index + length]
+        self._index += length
+        return res
+
+    def _read_until(self, token: bytes) -> bytes:
+        """
+            Read from the bencoded data until the given token is found and
+            return the characters read.
+        """
+        end = self._raw.find(token, self._index)
+        if end < 0:
+            raise EOFError(f'Unable to find token {str(token)}')
+        res = self._raw[self._index:end]
+        self._index = end + 1
+        return res
 
     def _decode_int(self):
-        ...
+        return int(self._read_until(TOKEN_END))
 
     def _decode_list(self):
-        ...
+        res = []
+        # Recursive decode the content of the list
+        while not self._at_end_token():
+            res.append(self.decode_data())
+        self._consume()  # The END token
+        return res
 
     def _decode_dict(self):
-        ...
+        res = OrderedDict()
+        self._depth += 1
+        while not self._at_end_token():
+            key = self.decode_data()
+            start = self._index
+            obj = self.decode_data()
+            if key == b'info' and self._depth == 1:
+                self.info_span = (start, self._index)
+            res[key] = obj
+        self._depth -= 1
+        self._consume()  # The END token
+        return res
+
+    def _decode_end(self):
+        return None
 
     def _decode_string(self):
-        ...
+        bytes_to_read = int(self._read_until(TOKEN_STRING_SEPARATOR))
+        return bytes(self._read(bytes_to_read))
+
+
+# Maps the token byte value to the method decoding the value it starts
+_DISPATCH = {
+    _INTEGER: Decoder._decode_int,
+    _LIST: Decoder._decode_list,
+    _DICT: Decoder._decode_dict,
+    _END: Decoder._decode_end,
+}
 
 
 class Encoder:
     """
         Encodes a python object to a bencoded sequences of bytes.
-        Any other type will be simply ignored.
+        An unsupported top-level value is ignored, while an unsupported
+        value nested in a list or dictionary raises a TypeError.
     """
     def __init__(self, data: Union[bytes, str, int, List, Dict]):
         self._data = data
 
-    @staticmethod
     def encode_data(self) -> bytes:
-        return self.encode_next_data(self._data)
-
-    def encode_next_data(self, data):
-        is_string = type(data) is str
-        is_int = type(data) is int
-        is_list = type(data) is list
-        is_dict = type(data) in (dict, OrderedDict)
-        is_bytes = type(data) is bytes
-
-        if is_string:
-            return self._encode_string(data)
-        elif is_int:
-            return self._encode_int(data)
-        elif is_list:
-            return self._encode_list(data)
-        elif is_dict:
-            return self._encode_dict(data)
-        elif is_bytes:
-            return self._encode_bytes(data)
-        else:
+        """
+            Encodes the data given to this encoder.
+
+            All values are appended to a single buffer which is only
+            converted to bytes once the whole structure has been encoded.
+
+            Params:
+                return: The bencoded data or None if the type of the data
+                        is not supported.
+        """
+        buf = bytearray()
+        if self.encode_into(buf) is None:
             return None
+        return bytes(buf)
 
-    def _encode_int(self, value: int):
-        return str.encode(f'i{str(value)}e')
-
-    def _encode_string(self, value: str):
-        res = f'{str(len(value))}:{value}'
-        return str.encode(res)
-
-    def _encode_bytes(self, value: str):
-        result = bytearray()
-        result += str.encode(str(len(value)))
-        result += b':'
-        result += value
-        return result
-
-    def _encode_list(self, data: List):
-        result = bytearray('8', 'utf-8')
-        result += b''.join([self.encode_next(item) for item in data])
-        result += b'e'
-        return result
-
-    def _encode_dict(self):
-        result = bytearray('d', 'utf-8')
-        return result
+    def encode_into(self, buf: bytearray):
+        """
+            Appends the encoded data to a buffer owned by the caller.
+
+            Params:
+                return: The buffer, or None if the type is not supported.
+        """
+        return self.encode_next_data(self._data, buf)
+
+    def encode_next_data(self, data, buf: bytearray):
+        """
+            Appends the bencoded representation of data to the given buffer.
+
+            Params:
+                return: The buffer, or None if the type is not supported.
+        """
+        handler = _ENCODERS.get(type(data))
+        if handler:
+            return handler(self, data, buf)
+        return None
+
+    def _encode_int(self, value: int, buf: bytearray):
+        buf += b'i%de' % value
+        return buf
+
+    def _encode_string(self, value: str, buf: bytearray):
+        return self._encode_bytes(value.encode('utf-8'), buf)
+
+    def _encode_bytes(self, value: bytes, buf: bytearray):
+        buf += b'%d:' % len(value)
+        buf += value
+        return buf
+
+    def _encode_list(self, data: List, buf: bytearray):
+        buf += b'l'
+        for item in data:
+            if self.encode_next_data(item, buf) is None:
+                raise TypeError(f'Unsupported list item: {item!r}')
+        buf += b'e'
+        return buf
+
+    def _encode_dict(self, data: Dict, buf: bytearray):
+        buf += b'd'
+        for key, value in data.items():
+            if self.encode_next_data(key, buf) is None:
+                raise TypeError(f'Unsupported dictionary key: {key!r}')
+            if self.encode_next_data(value, buf) is None:
+                raise TypeError(f'Unsupported dictionary value: {value!r}')
+        buf += b'e'
+        return buf
+
+
+# Maps the (exact) type of a value to the method encoding it
+_ENCODERS = {
+    str: Encoder._encode_string,
+    int: Encoder._encode_int,
+    list: Encoder._encode_list,
+    dict: Encoder._encode_dict,
+    OrderedDict: Encoder._encode_dict,
+    bytes: Encoder._encode_bytes,
+}
@@ -7,20 +7,32 @@ from concurrent.futures import CancelledError
 
 from src.torrent import Torrent
 from src.client import TorrentClient
+from src.tracker import close_session
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('torrent', help='the .torrent to download')
-    parser.add_argument('-v',
+    parser.add_argument('-v', '--verbose',
                         action='store_true',
                         help='enable verbose output')
+    parser.add_argument('--uvloop',
+                        action='store_true',
+                        help='run on the uvloop event loop (if installed)')
 
     args = parser.parse_args()
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
 
-    loop = asyncio.get_event_loop()
+    if args.uvloop:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            logging.warning('uvloop is not installed, using asyncio')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     client = TorrentClient(Torrent(args.torrent))
     task = loop.create_task(client.start())
 
@@ -35,3 +47,5 @@ def main():
         loop.run_until_complete(task)
     except CancelledError:
         logging.warning('Event loop was canceled')
+    finally:
+        loop.run_until_complete(close_session())
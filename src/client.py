@@ -1,4 +1,4 @@
-from src.protocol import PeerConnection, REQUEST_SIZE
+from src.protocol import PeerConnection, REQUEST_SIZE, BIT_MASK, has_piece
 from src.tracker import Tracker
 import asyncio
 from asyncio import Queue
@@ -6,12 +6,31 @@ import logging
 import math
 import os
 import time
-from collections import namedtuple, defaultdict
+from collections import deque, namedtuple
 from hashlib import sha1
+import heapq
 
 
 MAX_PEER_CONNECTIONS = 40
 
+# The maximum number of piece buffers kept for reuse once their piece has
+# been written to disk.
+MAX_POOLED_BUFFERS = 32
+
+# Piece buffers available for reuse
+_BUF_POOL = deque(maxlen=MAX_POOLED_BUFFERS)
+
+
+def _acquire_buffer(length: int) -> bytearray:
+    """
+        Get a buffer of the given length, reusing a pooled one if possible.
+    """
+    while _BUF_POOL:
+        buf = _BUF_POOL.pop()
+        if len(buf) == length:
+            return buf
+    return bytearray(length)
+
 
 class TorrentClient:
     """
@@ -88,8 +107,10 @@ class TorrentClient:
         self.stop()
 
     def _empty_queue(self):
-        while not self.available_peers.empty():
-            self.available_peers.get_nowait()
+        # Clearing the underlying deque has the same effect as calling
+        # get_nowait() until the queue is empty (neither touch the unfinished
+        # tasks counter nor any waiting consumer) in a single call.
+        self.available_peers._queue.clear()
 
     def stop(self):
         """
@@ -127,17 +148,19 @@ class Block:
 
         A block is most often of the same as the REQUEST_SIZE, except for the
         final block which might (most likely) is smaller than REQUEST_SIZE
+
+        Blocks are not kept for the lifetime of the download, the owning Piece
+        stores the state of all its blocks and a Block is only created when
+        it is requested.
     """
     Missing = 0
     Pending = 1
     Retrieved = 2
 
     def __init__(self, piece: int, offset: int, length: int):
-        self.piece = piece,
-        self.offset = offset,
-        self.length = length,
-        self.status = Block.Missing,
-        self.data = None
+        self.piece = piece
+        self.offset = offset
+        self.length = length
 
 
 class Piece:
@@ -152,30 +175,52 @@ class Piece:
         specification uses piece for this one as well, which is slighly
         confusing).
 
+        The blocks of a piece are stored as arrays indexed by the block number
+        (i.e. offset // REQUEST_SIZE) rather than one object per block.
     """
-    def __init__(self, index: int, blocks: [], hash_value):
+    def __init__(self, index: int, length: int, hash_value):
         self.index = index
-        self.blocks = blocks
+        self.length = length
         self.hash = hash_value
+        num_blocks = math.ceil(length / REQUEST_SIZE)
+        self.status = bytearray([Block.Missing] * num_blocks)
+        # The received blocks are copied into place in this buffer, so the
+        # piece data is ready as soon as the final block arrives. The buffer
+        # is only acquired once the first block arrives.
+        self._buf = None
+        self._received = 0
+        # The SHA1 is updated with the blocks received in order, so most of
+        # the hashing is done while the remaining blocks are downloaded.
+        self._sha = sha1()
+        self._hashed = 0
+
+    def _block_length(self, block_index: int) -> int:
+        """
+            The length of the given block, only the final block of the piece
+            might be shorter than REQUEST_SIZE.
+        """
+        return min(REQUEST_SIZE, self.length - block_index * REQUEST_SIZE)
 
     def reset(self):
         """
             Reset all blocks to Missing regardless of current state.
         """
-
-        for block in self.blocks:
-            block.status = Block.Missing
+        self.status[:] = bytes(len(self.status))
+        self._received = 0
+        self._sha = sha1()
+        self._hashed = 0
 
     def next_request(self):
         """
             Get the next Block to be requested.
         """
-        missing = [b for b in self.blocks if b.status is Block.Missing] 
-
-        if missing:
-            missing[0].status = Block.Pending
-            return missing[0]
-        return None
+        block_index = self.status.find(Block.Missing)
+        if block_index < 0:
+            return None
+        self.status[block_index] = Block.Pending
+        return Block(self.index,
+                     block_index * REQUEST_SIZE,
+                     self._block_length(block_index))
 
     def block_received(self, offset: int, data: bytes):
         """
@@ -185,15 +230,40 @@ class Piece:
                 offset: The block offset (within the piece)
                 data: The block data
         """
-        matches = [b for b in self.blocks if b.offset == offset]
-        block = matches[0] if matches else None
-
-        if block:
-            block.status = Block.Retrieved
-            block.data = data 
+        block_index = offset // REQUEST_SIZE
+        if offset % REQUEST_SIZE == 0 and block_index < len(self.status):
+            if len(data) != self._block_length(block_index):
+                # Assigning a slice of another length would resize the
+                # buffer, moving the data of the following blocks.
+                logging.warning('Discarding block %d of invalid length %d',
+                                offset, len(data))
+                if self.status[block_index] == Block.Pending:
+                    self.status[block_index] = Block.Missing
+                return
+            if self.status[block_index] != Block.Retrieved:
+                self.status[block_index] = Block.Retrieved
+                self._received += 1
+                if self._buf is None:
+                    self._buf = _acquire_buffer(self.length)
+                self._buf[offset:offset + len(data)] = data
+                self._update_hash()
         else:
-            logging.warning(
-                f'Trying to complete a non-existing block {offset}')
+            logging.warning('Trying to complete a non-existing block %d',
+                            offset)
+
+    def _update_hash(self):
+        """
+            Feed the hash with the consecutive retrieved blocks following
+            the ones already hashed.
+        """
+        view = memoryview(self._buf)
+        block_index = self._hashed // REQUEST_SIZE
+        while block_index < len(self.status) and \
+                self.status[block_index] == Block.Retrieved:
+            end = min(self._hashed + REQUEST_SIZE, self.length)
+            self._sha.update(view[self._hashed:end])
+            self._hashed = end
+            block_index += 1
 
     def is_complete(self) -> bool:
         """
@@ -203,9 +273,7 @@ class Piece:
             return: True or False
 
         """
-        blocks = [b for b in self.blocks
-                  if b.status is not Block.Retrieved]
-        return len(blocks) == 0
+        return self._received == len(self.status)
 
     def is_hash_matching(self):
         """
@@ -214,21 +282,28 @@ class Piece:
 
             return: True or False
         """
-        piece_hash = sha1(self.data).digest()
-        return self.hash == piece_hash
+        self._update_hash()
+        return self.hash == self._sha.digest()
 
     @property
     def data(self):
         """
-            Return the data for this piece (by concatenating all blocks in
-            order)
+            Return the data for this piece (the blocks are stored in order
+            as they are received)
 
             NOTE: This method does not control all blocks are valid or even
             existing!
         """
-        retrieved = sorted(self.blocks, key=lambda b: b.offset)
-        blocks_data = [b.data for b in retrieved]
-        return b''.join(blocks_data)
+        return self._buf
+
+    def release(self):
+        """
+            Return the buffer of this piece to the pool, its data must not be
+            used afterwards.
+        """
+        if self._buf is not None:
+            _BUF_POOL.append(self._buf)
+            self._buf = None
 
 
 PendingRequest = namedtuple('PendingRequest', ['block', 'added'])
@@ -247,14 +322,25 @@ class PieceManager:
     def __init__(self, torrent):
         self.torrent = torrent
         self.peers = {}
-        self.pending_blocks = []
+        # Pending requests keyed by (piece index, block offset), together
+        # with a heap of (added, piece index, block offset) ordered by the
+        # time of the request. Entries in the heap which are no longer
+        # pending (or have been re-requested) are skipped when popped.
+        self.pending_blocks = {}
+        self._pending_heap = []
         self.missing_pieces = []
-        self.ongoing_pieces = []
+        # Pieces started but not yet completed, keyed by piece index
+        self.ongoing_pieces = {}
         self.have_pieces = []
-        self.max_pending_time = 300 * 1000
+        # Time (in nanoseconds) before a pending request is re-requested
+        self.max_pending_time = 300 * 10**9
         self.missing_pieces = self._initiate_pieces()
         self.total_pieces = len(torrent.pieces)
+        # The number of connected peers having each piece, kept up to date
+        # as peers are added, removed and announce new pieces.
+        self._rarity = [0] * self.total_pieces
         self.fd = os.open(self.torrent.output_file, os.O_RDWR | os.O_CREAT)
+        self._allocate()
 
     def _initiate_pieces(self) -> [Piece]:
         """
@@ -263,33 +349,31 @@ class PieceManager:
         """
         torrent = self.torrent
         pieces = []
-        total_pieces = len(torrent.pieces)
-        std_piece_blocks = math.ceil(torrent.piece_length / REQUEST_SIZE)
-
         for index, hash_value in enumerate(torrent.pieces):
-
-            if index < (total_pieces - 1):
-                blocks = [Block(index, offset * REQUEST_SIZE, REQUEST_SIZE)
-                          for offset in range(std_piece_blocks)]
-            else:
-                last_length = torrent.total_size % torrent.piece_length
-                num_blocks = math.ceil(last_length / REQUEST_SIZE)
-                blocks = [Block(index, offset * REQUEST_SIZE, REQUEST_SIZE)
-                          for offset in range(num_blocks)]
-
-                if last_length % REQUEST_SIZE > 0:
-                    last_block = blocks[-1]
-                    last_block.length = last_length % REQUEST_SIZE
-                    blocks[-1] = last_block
-            pieces.append(Piece(index, blocks, hash_value))
+            # Only the final piece might be shorter than the piece length
+            offset = index * torrent.piece_length
+            length = min(torrent.piece_length, torrent.total_size - offset)
+            pieces.append(Piece(index, length, hash_value))
         return pieces
 
+    def _allocate(self):
+        """
+            Reserve the disk space for the whole output file up front, so
+            writing pieces does not need to extend the file.
+        """
+        try:
+            os.posix_fallocate(self.fd, 0, self.torrent.total_size)
+        except (AttributeError, OSError):
+            # Not available on this platform or file system
+            os.ftruncate(self.fd, self.torrent.total_size)
+
     def close(self):
         """
             Close any resources used by the PieceManager (such as open files)
         """
-        if self.id:
+        if self.fd is not None:
             os.close(self.fd)
+            self.fd = None
 
     @property
     def complete(self):
@@ -318,16 +402,34 @@ class PieceManager:
     def add_peer(self, peer_id, bitfield):
         """
             Adds a peer and the bitfield representing the pieces the peer has.
+
+            The bitfield is kept by reference, it is only copied if the peer
+            later announces a new piece.
         """
+        self.remove_peer(peer_id)
         self.peers[peer_id] = bitfield
+        self._update_rarity(bitfield, 1)
 
-    def update_peer(self, peer_id):
+    def update_peer(self, peer_id, index: int):
         """
             Updates the information about which pieces a peer has (reflects a 
             Have message).
-        """
-        if peer_id in self.peers:
-            del self.peers[peer_id]
+
+            Peers starting without any pieces may skip the BitField message,
+            such a peer is added with an empty bitfield.
+        """
+        if index < self.total_pieces:
+            bitfield = self.peers.get(peer_id)
+            if bitfield is None:
+                bitfield = self.peers[peer_id] = bytearray(
+                    (self.total_pieces + 7) // 8)
+            if not has_piece(bitfield, index):
+                if not isinstance(bitfield, bytearray):
+                    bitfield = self.peers[peer_id] = bytearray(bitfield)
+                if len(bitfield) <= index >> 3:
+                    bitfield.extend(bytes((index >> 3) + 1 - len(bitfield)))
+                bitfield[index >> 3] |= BIT_MASK[index & 7]
+                self._rarity[index] += 1
 
     def remove_peer(self, peer_id):
         """
@@ -335,8 +437,22 @@ class PieceManager:
             connection is dropped)
         """
         if peer_id in self.peers:
+            self._update_rarity(self.peers[peer_id], -1)
             del self.peers[peer_id]
 
+    def _update_rarity(self, bitfield, delta: int):
+        """
+            Adds delta to the rarity count of every piece in the bitfield.
+        """
+        rarity = self._rarity
+        for byte_index, byte in enumerate(bitfield):
+            if not byte:
+                continue
+            for bit in range(8):
+                index = (byte_index << 3) + bit
+                if byte & BIT_MASK[bit] and index < self.total_pieces:
+                    rarity[index] += delta
+
     def next_request(self, peer_id) -> Block:
         """
             Get the next Block that should be requested from the given peer.
@@ -359,11 +475,15 @@ class PieceManager:
         if peer_id not in self.peers:
             return None
 
-        block = self._expired_requests(peer_id)
+        current = time.monotonic_ns()
+        block = self._expired_requests(peer_id, current)
         if not block:
-            block = self._next_ongoing(peer_id)
+            block = self._next_ongoing(peer_id, current)
             if not block:
-                block = self._get_rarest_piece(peer_id).next_request()
+                piece = self._get_rarest_piece(peer_id)
+                block = piece.next_request() if piece else None
+                if block:
+                    self._add_pending(block, current)
         return block
 
     def block_received(self, peer_id, piece_index, block_offset, data):
@@ -376,38 +496,34 @@ class PieceManager:
             state to be fetched again. If the hash succeeds the partial piece
             is written to disk and the piece is indicated as Have.
         """
-        logging.debug(f'Received block {block_offset} for piece {piece_index}'
-                      f'from peer {peer_id}: ')
+        logging.debug('Received block %d for piece %d from peer %s',
+                      block_offset, piece_index, peer_id)
 
-        for index, request in enumerate(self.pending_blocks):
-            if request.block.piece == piece_index and \
-               request.block.offset == block_offset:
-                del self.pending_blocks[index]
-                break
+        self.pending_blocks.pop((piece_index, block_offset), None)
 
-        pieces = [p for p in self.ongoing_pieces if p.index == piece_index]
-        piece = pieces[0] if pieces else None
+        piece = self.ongoing_pieces.get(piece_index)
         if piece:
             piece.block_received(block_offset, data)
-            if piece.is_complete():
+            if not piece.is_complete():
+                return
+            if piece.is_hash_matching():
                 self._write(piece)
-                self.ongoing_pieces.remove(piece)
+                piece.release()
+                del self.ongoing_pieces[piece.index]
                 self.have_pieces.append(piece)
                 complete = (self.total_pieces -
                             len(self.missing_pieces) -
                             len(self.ongoing_pieces))
                 per = (complete / self.total_pieces) * 100
-                logging.info(
-                    f'{complete} / {self.total_pieces}'
-                    f'pieces downloaded {per:.3f} %'
-                )
+                logging.info('%d / %d pieces downloaded %.3f %%',
+                             complete, self.total_pieces, per)
             else:
-                logging.info(f'Discarding corrupt piece {piece.index}')
+                logging.info('Discarding corrupt piece %d', piece.index)
                 piece.reset()
         else:
             logging.warning('Trying to update piece that is not ongoing.')
 
-    def _expired_requests(self, peer_id) -> Block:
+    def _expired_requests(self, peer_id, current: int) -> Block:
         """
             Go through previously requested blocks, if any one have been in the
             requested state for longer than 'MAX_PENDING_TIME' return to block
@@ -415,29 +531,47 @@ class PieceManager:
 
             if no pending blocks exist, None is returned.
         """
-        current = int(round(time.time() * 1000))
-        for request in self.pending_blocks:
-            if self.peers[peer_id][request.block.piece]:
-                if request.added + self.max_pending_time < current:
-                    logging.info(f'Re-requesting block {request.block.offset}'
-                                 f'for piece {request.block.piece}')
+        heap = self._pending_heap
+        skipped = []
+        block = None
+        while heap and heap[0][0] + self.max_pending_time < current:
+            entry = heapq.heappop(heap)
+            added, piece_index, offset = entry
+            request = self.pending_blocks.get((piece_index, offset))
+            if not request or request.added != added:
+                # Already received or re-requested since
+                continue
+            if has_piece(self.peers[peer_id], piece_index):
+                logging.info('Re-requesting block %d for piece %d',
+                             offset, piece_index)
+                block = request.block
+                self._add_pending(block, current)
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return block
 
-                    request.added = current
-                    return request.block
-        return None
+    def _add_pending(self, block: Block, added: int):
+        """
+            Register the given block as requested at the given monotonic time
+            (in nanoseconds).
+        """
+        self.pending_blocks[(block.piece, block.offset)] = \
+            PendingRequest(block, added)
+        heapq.heappush(self._pending_heap, (added, block.piece, block.offset))
 
-    def _next_ongoing(self, peer_id) -> Block:
+    def _next_ongoing(self, peer_id, current: int) -> Block:
         """
             Go through the ongoing pieces and return the next block to be
             requested or None if no block is left to be requested. 
         """
-        for piece in self.ongoing_pieces:
-            if self.peers[peer_id][piece.index]:
+        for piece in self.ongoing_pieces.values():
+            if has_piece(self.peers[peer_id], piece.index):
 
                 block = piece.next_request()
                 if block:
-                    self.pending_blocks.append(
-                        PendingRequest(block, int(round(time.time() * 1000))))
+                    self._add_pending(block, current)
                     return block
         return None
 
@@ -446,17 +580,19 @@ class PieceManager:
             Given the current list of missing pieces, get the rarest one
             first (i.e. a piece which fewest of its neighboring peers have)
         """
-        piece_count = defaultdict(int)
+        bitfield = self.peers[peer_id]
+        rarest_piece = None
         for piece in self.missing_pieces:
-            if not self.peers[peer_id][piece.index]:
+            if not has_piece(bitfield, piece.index):
                 continue
-            for p in self.peers:
-                if self.peers[p][piece.index]:
-                    piece_count[piece] += 1
+            if rarest_piece is None or \
+               self._rarity[piece.index] < self._rarity[rarest_piece.index]:
+                rarest_piece = piece
 
-        rarest_piece = min(piece_count, key=lambda p: piece_count[p])
+        if rarest_piece is None:
+            return None
         self.missing_pieces.remove(rarest_piece)
-        self.ongoing_pieces.append(rarest_piece)
+        self.ongoing_pieces[rarest_piece.index] = rarest_piece
         return rarest_piece
 
     def _next_missing(self, peer_id) -> Block:
@@ -469,10 +605,10 @@ class PieceManager:
             blocks for that piece, rather get the next missing piece.
         """
         for index, piece in enumerate(self.missing_pieces):
-            if self.peers[peer_id][piece.index]:
+            if has_piece(self.peers[peer_id], piece.index):
                 # Move this piece from missing to ongoing
                 piece = self.missing_pieces.pop(index)
-                self.ongoing_pieces.append(piece)
+                self.ongoing_pieces[piece.index] = piece
                 # The missing pieces does not have any previously requested
                 # blocks (then it is ongoing).
                 return piece.next_request()
@@ -483,5 +619,5 @@ class PieceManager:
             Write the given piece to disk
         """
         pos = piece.index * self.torrent.piece_length
-        os.lseek(self.fd, pos, os.SEEK_SET)
-        os.write(self.fd, piece.data)
+        # pwrite does not depend on (nor move) the shared file offset
+        os.pwrite(self.fd, memoryview(piece.data)[:piece.length], pos)
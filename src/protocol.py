@@ -1,14 +1,52 @@
 import asyncio
 import logging
+import socket
 import struct
 from asyncio import Queue
 from concurrent.futures import CancelledError
-import bitstring
 
 REQUEST_SIZE = 2**14
 
+# Time (in seconds) to wait for a connection to the remote peer to open
+CONNECT_TIMEOUT = 3
 
-class ProtocolError(BaseException):
+# Time (in seconds) to wait for the remote peer to respond with its handshake
+HANDSHAKE_TIMEOUT = 10
+
+# The number of block requests pipelined (outstanding) to a single peer
+MAX_PENDING_REQUESTS = 5
+
+# Precompiled formats of the messages (and message parts) with fixed layout
+_U32 = struct.Struct('>I')
+_HDR = struct.Struct('>Ib')
+_HAVE = struct.Struct('>IbI')
+_REQ = struct.Struct('>IbIII')
+_PIECE = struct.Struct('>IbII')
+_PIECE_BODY = struct.Struct('>xII')
+_HAVE_BODY = struct.Struct('>xI')
+_HS = struct.Struct('>B19s8x20s20s')
+
+# The encoded form of the messages without any payload, these never change
+KEEPALIVE_WIRE = _U32.pack(0)
+CHOKE_WIRE = _HDR.pack(1, 0)
+UNCHOKE_WIRE = _HDR.pack(1, 1)
+INTERESTED_WIRE = _HDR.pack(1, 2)
+NOTINTERESTED_WIRE = _HDR.pack(1, 3)
+
+# The mask of each bit within a byte of a bitfield, the high bit of the
+# first byte corresponds to piece index 0.
+BIT_MASK = [1 << (7 - i) for i in range(8)]
+
+
+def has_piece(bitfield: bytes, index: int) -> bool:
+    """
+        Checks if the piece at the given index is set in the bitfield.
+    """
+    byte = index >> 3
+    return byte < len(bitfield) and bitfield[byte] & BIT_MASK[index & 7] != 0
+
+
+class ProtocolError(Exception):
     pass
 
 
@@ -22,9 +60,9 @@ class PeerConnection:
         connection and perform a BitTorrent handshake.
 
         After a successful handshake, the PeerConnection will be in a 'choked'
-        state, not allowed to request any data from the remote peer. After
-        sending an interested message the PeerConnection will be waiting to get
-        'unchocked'.
+        state (the CHOKED flag), not allowed to request any data from the
+        remote peer. After sending an interested message the PeerConnection
+        will be waiting to get 'unchoked'.
 
         Once the remote peer unchoked us, we can start requesting pieces.
         The PeerConnection will continue to request pieces for as long as
@@ -35,6 +73,16 @@ class PeerConnection:
         to that one instead.
     """
 
+    __slots__ = ('my_state', 'peer_state', 'pending_requests', 'queue',
+                 'info_hash', 'peer_id', 'remote_id', 'writer', 'reader',
+                 'piece_manager', 'on_block_cb', '_handshake_wire',
+                 '_handlers', 'future')
+
+    # Flags making up the state of both ends of the connection
+    STOPPED = 1
+    CHOKED = 2
+    INTERESTED = 4
+
     def __init__(self,
                  queue: Queue,
                  info_hash,
@@ -56,8 +104,10 @@ class PeerConnection:
                 on_block_cb: The callback function to call when a
                              block is received from the peer.
         """
-        self.my_state = []
-        self.peer_state = []
+        self.my_state = 0
+        self.peer_state = 0
+        # The number of requested blocks not yet received
+        self.pending_requests = 0
         self.queue = queue
         self.info_hash = info_hash
         self.peer_id = peer_id
@@ -66,99 +116,166 @@ class PeerConnection:
         self.reader = None
         self.piece_manager = piece_manager
         self.on_block_cb = on_block_cb
+        # The handshake (followed by the interested message) sent to every
+        # peer, it only depends on the torrent and our peer ID.
+        self._handshake_wire = Handshake(info_hash, peer_id).encode() + \
+            INTERESTED_WIRE
+        # The method handling each type of message received from the peer
+        self._handlers = {
+            BitField: self._on_bitfield,
+            Interested: self._on_interested,
+            NotInterested: self._on_not_interested,
+            Choke: self._on_choke,
+            Unchoke: self._on_unchoke,
+            Have: self._on_have,
+            KeepAlive: self._on_keep_alive,
+            Piece: self._on_piece,
+            Request: self._on_request,
+            Cancel: self._on_cancel,
+        }
         self.future = asyncio.ensure_future(self._start())
 
     async def _start(self):
-        while 'stopped' not in self.my_state:
+        while not self.my_state & PeerConnection.STOPPED:
             ip, port = await self.queue.get()
-            logging.info(f'Got assigned peer with: {ip}')
+            # The address is kept packed until actually connecting to it
+            host = socket.inet_ntoa(ip)
+            logging.info('Got assigned peer with: %s', host)
 
             try:
-                self.reader, self.writer = await asyncio.open_connection(
-                    ip, port
-                )
-                logging.info(f'Connection to the peer: {ip}')
-
-                buffer = await self._handshake()
-
-                self.my_state.append('chocked')
-
-                await self._send_interested()
-                self.my_state.append('interested')
-
-                async for message in PeerStreamIterator(self.reader, buffer):
-                    is_bitfield = isinstance(message, BitField)
-                    is_interested = isinstance(message, Interested)
-                    is_notinterested = isinstance(message, NotInterested)
-                    is_choke = isinstance(message, Choke)
-                    is_unchoke = isinstance(message, Unchoke)
-                    is_have = isinstance(message, Have)
-                    is_keepalive = isinstance(message, KeepAlive)
-                    is_piece = isinstance(message, Piece)
-                    is_request = isinstance(message, Request)
-                    is_cancel = isinstance(message, Cancel)
-
-                    if 'stopped' in self.my_state:
-                        break
-                    if is_bitfield:
-                        self.piece_manager.add_peer(self.remote_id,
-                                                    message.bitfield)
-                    elif is_interested:
-                        self.peer_state.append('interested')
-                    elif is_notinterested:
-                        if 'interested' in self.peer_state:
-                            self.peer_state.remove('interested')
-                    elif is_choke:
-                        self.my_state.append('choked')
-                    elif is_unchoke:
-                        if 'choked' in self.my_state:
-                            self.my_state.remove('choked')
-                    elif is_have:
-                        self.piece_manager.update_peer(self.remote_id,
-                                                       message.index)
-                    elif is_keepalive:
-                        pass
-                    elif is_piece:
-                        self.my_state.remove('pending_request')
-                        self.on_block_cb(
-                            peer_id=self.remote_id,
-                            piece_index=message.index,
-                            block_offset=message.begin,
-                            data=message.block)
-                    elif is_request:
-                        logging.info('Ignoring the received Request message.')
-                    elif is_cancel:
-                        logging.info('Ignoring the received Cancel message.')
-
-                    choked_not_in = 'choked' not in self.my_state
-                    interested_in = 'interested' in self.my_state
-                    pending_request_not_in = (
-                        'pending_request' not in self.my_state)
-
-                    if (choked_not_in and interested_in and
-                            pending_request_not_in):
-
-                        self.my_state.append('pending_request')
-                        await self._request_piece()
+                self.reader, self.writer = await self._connect(host, port)
+            except (OSError, TimeoutError):
+                logging.exception('Unable to connect to peer')
+                self._close()
+                continue
+            logging.info('Connection to the peer: %s', host)
 
+            try:
+                if not await self._run():
+                    logging.info('Handshake with the peer failed: %s', host)
             except ProtocolError:
                 logging.exception('Protocol error')
-            except (ConnectionRefusedError, TimeoutError):
-                logging.exception('Unable to connect to peer')
+            except TimeoutError:
+                logging.exception('Peer did not respond')
             except (ConnectionResetError, CancelledError):
                 logging.exception('Connection closed')
             except Exception as e:
                 logging.exception('An error occurred')
                 self.cancel()
                 raise e
-            self.cancel()
+            self._close()
+
+    async def _connect(self, host, port):
+        """
+            Opens the connection to the given peer, giving up after
+            CONNECT_TIMEOUT seconds rather than waiting for the operating
+            system to time out the attempt.
+
+            Params:
+                host: The IP address of the peer
+                port: The port of the peer
+                return: The (reader, writer) pair of the connection
+        """
+        return await asyncio.wait_for(asyncio.open_connection(host, port),
+                                      timeout=CONNECT_TIMEOUT)
+
+    async def _run(self):
+        """
+            Runs the session with the connected peer: the handshake followed
+            by handling the peer's messages, until either end closes the
+            connection.
+
+            Params:
+                return: False if the handshake with the peer failed
+        """
+        if not await self._handshake():
+            return False
+
+        self.my_state |= PeerConnection.CHOKED
+        self.my_state |= PeerConnection.INTERESTED
+
+        async for message in PeerStreamIterator(self.reader):
+            if self.my_state & PeerConnection.STOPPED:
+                break
+            message_type = type(message)
+            handler = self._handlers.get(message_type)
+            if handler:
+                handler(message)
+            if message_type not in _REQUEST_AFTER:
+                continue
+
+            # Request pieces only when unchoked, interested and
+            # the request pipeline is not full
+            mask = PeerConnection.CHOKED | PeerConnection.INTERESTED
+            if self.my_state & mask == PeerConnection.INTERESTED and \
+                    self.pending_requests < MAX_PENDING_REQUESTS:
+                await self._request_pieces()
+        return True
+
+    def _on_bitfield(self, message):
+        self.piece_manager.add_peer(self.remote_id, message.bitfield)
+
+    def _on_interested(self, message):
+        self.peer_state |= PeerConnection.INTERESTED
+
+    def _on_not_interested(self, message):
+        self.peer_state &= ~PeerConnection.INTERESTED
+
+    def _on_choke(self, message):
+        # The peer discards any requests when choking, those blocks are
+        # requested again by the piece manager once they have expired.
+        self.my_state |= PeerConnection.CHOKED
+        self.pending_requests = 0
+
+    def _on_unchoke(self, message):
+        self.my_state &= ~PeerConnection.CHOKED
+
+    def _on_have(self, message):
+        self.piece_manager.update_peer(self.remote_id, message.index)
+
+    def _on_keep_alive(self, message):
+        pass
+
+    def _on_piece(self, message):
+        if self.pending_requests > 0:
+            self.pending_requests -= 1
+        self.on_block_cb(
+            peer_id=self.remote_id,
+            piece_index=message.index,
+            block_offset=message.begin,
+            data=message.block)
+
+    def _on_request(self, message):
+        logging.info('Ignoring the received Request message.')
+
+    def _on_cancel(self, message):
+        logging.info('Ignoring the received Cancel message.')
+
+    def _close(self):
+        """
+            Closes the connection to the current peer, leaving this
+            PeerConnection ready to consume the next peer from the queue.
+        """
+        logging.info('Closing peer %s', self.remote_id)
+        if self.writer:
+            self.writer.close()
+        self.piece_manager.remove_peer(self.remote_id)
+        self.reader = None
+        self.writer = None
+        self.remote_id = None
+        self.pending_requests = 0
+        # Nothing of the state of this connection carries over to the next
+        # peer, except being stopped.
+        self.my_state &= PeerConnection.STOPPED
+        self.peer_state = 0
+        self.queue.task_done()
 
     def cancel(self):
         """
             Sends the cancel message to the remote peer and closes the
             connection.
         """
-        logging.info(f'Closing peer {self.remote_id}')
+        logging.info('Closing peer %s', self.remote_id)
         if not self.future.done():
             self.future.cancel()
         if self.writer:
@@ -171,55 +288,70 @@ class PeerConnection:
             Stop this connection from the current peer (if a connection exist)
             and from connecting to any new peer.
         """
-        self.my_state.append('stopped')
+        self.my_state |= PeerConnection.STOPPED
         if not self.future.done():
             self.future.cancel()
 
-    async def _request_piece(self):
-        block = self.piece_manager.next_request(self.remote_id)
-        if block:
-            message = Request(block.piece,
-                              block.offset,
-                              block.length).encode()
-            logging.debug(f"""
-                            Requesting block {block.piece}
-                            for piece {block.offset}
-                            of {block.length}
-                            bytes from peer {self.remote_id}
-                           """)
-            self.writer.write(message)
+    async def _request_pieces(self):
+        """
+            Fill up the request pipeline to the remote peer, the requests are
+            written together and drained once.
+        """
+        messages = []
+        while self.pending_requests < MAX_PENDING_REQUESTS:
+            block = self.piece_manager.next_request(self.remote_id)
+            if not block:
+                break
+            messages.append(_REQ.pack(13,
+                                      PeerMessage.REQUEST,
+                                      block.piece,
+                                      block.offset,
+                                      block.length))
+            self.pending_requests += 1
+            logging.debug('Requesting block %d for piece %d of %d bytes '
+                          'from peer %s', block.offset, block.piece,
+                          block.length, self.remote_id)
+        if messages:
+            self.writer.writelines(messages)
             await self.writer.drain()
 
     async def _handshake(self):
         """
             Send the initial handshake to the remote peer and wait for the peer
             to respond with its handshake.
+
+            The interested message is sent together with the handshake, in
+            a single write, since we always want to download from the peer.
+
+            A peer failing the handshake is common, so rather than raising an
+            error that is logged and False returned.
+
+            Params:
+                return: True if the handshake was successful
         """
-        self.writer.write(Handshake(self.info_hash, self.peer_id).encode())
+        logging.debug('Sending message: Interested')
+        self.writer.write(self._handshake_wire)
         await self.writer.drain()
 
-        buf = b''
-        tries = 1
-        while len(buf) < Handshake.length and tries < 10:
-            tries += 1
-            buf = await self.reader.read(PeerStreamIterator.CHUNK_SIZE)
+        try:
+            buf = await asyncio.wait_for(
+                self.reader.readexactly(Handshake.length),
+                timeout=HANDSHAKE_TIMEOUT)
+        except asyncio.IncompleteReadError:
+            logging.info('Connection closed during handshake')
+            return False
 
-        response = Handshake.decode(buf[:Handshake.length])
+        response = Handshake.decode(buf)
         if not response:
-            raise ProtocolError('Unable receive and parse a handshake')
+            logging.info('Unable receive and parse a handshake')
+            return False
         if not response.info_hash == self.info_hash:
-            raise ProtocolError('Handshake with invalid info_hash')
+            logging.info('Handshake with invalid info_hash')
+            return False
 
         self.remote_id = response.peer_id
         logging.info('Handshake with peer was successful')
-
-        return buf[Handshake.length:]
-
-    async def _send_interested(self):
-        message = Interested()
-        logging.debug(f'Sending message: {message}')
-        self.writer.write(message.encode())
-        await self.writer.drain()
+        return True
 
 
 class PeerStreamIterator:
@@ -228,129 +360,90 @@ class PeerStreamIterator:
         from the given stream reader and tries to parse valid BitTorrent
         messages from off that stream of bytes.
 
+        Each message is read in two steps, first the length prefix and then
+        exactly that many bytes, the stream reader does the buffering.
+
         If the connection is dropped, something fails the iterator will abort
         by raising the 'StopAsyncIteration' error ending the calling iteration.
     """
-    CHUNK_SIZE = 10*1024
 
-    def __init__(self, reader, initial: bytes = None):
+    def __init__(self, reader):
         self.reader = reader
-        self.buffer = initial if initial else b''
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return self
 
     async def __anext__(self):
         """
-            Read data from the socket. When we have enough data to parse, parse
-            it and return the message. Until then keep reading from stream.
+            Read the next message from the stream and return it.
         """
+        # Each message is structured as:
+        #   <length prefix><message ID><payload>
+        #
+        # The 'length prefix' is a four byte big-endian value
+        # The 'message ID' is a decimal byte
+        # The 'payload' is the value of 'length prefix'
+        #
+        # The message length is not part of the actual length. So another
+        # 4 bytes needs to be read after the length prefix.
         while True:
             try:
-                data = await self.reader.read(self.CHUNK_SIZE)
-                if data:
-                    self.buffer += data
-                    message = self.parse()
-                    if message:
-                        return message
-                else:
-                    logging.debug('No data read from stream')
-                    if self.buffer:
-                        message = self.parse()
-                        if message:
-                            return message
-                    raise StopAsyncIteration()
+                header = await self.reader.readexactly(4)
+                message_length = _U32.unpack(header)[0]
+                if message_length == 0:
+                    return _KEEPALIVE
+                body = await self.reader.readexactly(message_length)
+                message = self._decode(body)
+            except asyncio.IncompleteReadError:
+                logging.debug('No data read from stream')
+                raise StopAsyncIteration()
             except ConnectionResetError:
                 logging.debug('Connection closed by peer')
                 raise StopAsyncIteration()
             except CancelledError:
                 raise StopAsyncIteration()
-            except StopAsyncIteration as e:
-                raise e
             except Exception:
+                # Including malformed messages which cannot be decoded
                 logging.exception('Error when iterating over stream!')
                 raise StopAsyncIteration()
-            raise StopAsyncIteration()
 
-    def parse(self):
+            if message:
+                return message
+
+    @staticmethod
+    def _decode(body: bytes):
         """
-            Tries to parse protocol messages if there is enough bytes read
-            in the buffer.
+            Decodes a message read from the stream, raising an error if the
+            message is malformed.
 
             Params:
-                return: The parsed message, or None if no message could be 
-                parsed.
+                body: The message, without the length prefix
+                return: The decoded message, or None for unsupported messages
         """
-        # Each message is structured as:
-        #   <length prefix><message ID><payload>
-        #
-        # The 'length prefix' is a four byte big-endian value
-        # The 'message ID' is a decimal byte
-        # The 'payload' is the value of 'length prefix'
-        #
-        # The message length is not part of the actual length. So another
-        # 4 bytes needs to be included when slicing the buffer.
-        header_length = 4
-
-        if len(self.buffer) > 4:  # 4 bytes is needed to identify the message
-            message_length = struct.unpack('>I', self.buffer[0:4])[0]
-
-            if message_length == 0:
-                return KeepAlive()
-
-            if len(self.buffer) >= message_length:
-                message_id = struct.unpack('>b', self.buffer[4:5])[0]
-
-                def _consume():
-                    """
-                        Consume the current message from the read buffer.
-                    """
-                    self.buffer = self.buffer[header_length + message_length:]
-
-                def _data():
-                    """
-                        Extract the current message from the read buffer.
-                    """
-                    return self.buffer[:header_length + message_length]
-
-                if message_id is PeerMessage.BITFIELD:
-                    data = _data()
-                    _consume()
-                    return BitField.decode(data)
-                elif message_id is PeerMessage.INTERESTED:
-                    _consume()
-                    return Interested()
-                elif message_id is PeerMessage.NOTINTERESTED:
-                    _consume()
-                    return NotInterested
-                elif message_id is PeerMessage.CHOKE:
-                    _consume()
-                    return Choke()
-                elif message_id is PeerMessage.UNCHOKE:
-                    _consume()
-                    return Unchoke()
-                elif message_id is PeerMessage.HAVE:
-                    data = _data()
-                    _consume()
-                    return Have.decode(data)
-                elif message_id is PeerMessage.PIECE:
-                    data = _data()
-                    _consume()
-                    return Piece.decode(data)
-                elif message_id is PeerMessage.REQUEST:
-                    data = _data()
-                    _consume()
-                    return Request.decode(data)
-                elif message_id is PeerMessage.CANCEL:
-                    data = _data()
-                    _consume()
-                    return Cancel.decode(data)
-                else:
-                    logging.info('Unsupported message!')
-            else:
-                logging.debug('Not enough in buffer in order to parse.')
-
-        return None
+        message_id = body[0]
+        # Blocks make up nearly all of the received bytes and Have messages
+        # most of the received messages, these (and the messages without
+        # payload) are decoded straight from the body without joining the
+        # length prefix to it.
+        if message_id == PeerMessage.PIECE:
+            if len(body) < _PIECE_BODY.size:
+                raise ProtocolError('Piece message too short')
+            index, begin = _PIECE_BODY.unpack_from(body, 0)
+            return Piece(index, begin, memoryview(body)[_PIECE_BODY.size:])
+        if message_id == PeerMessage.HAVE:
+            if len(body) != _HAVE_BODY.size:
+                raise ProtocolError('Have message of invalid length')
+            return Have(_HAVE_BODY.unpack(body)[0])
+
+        message = _NO_PAYLOAD.get(message_id)
+        if message is not None:
+            return message
+
+        message_type = _MESSAGE_TYPES.get(message_id)
+        if message_type is None:
+            logging.info('Unsupported message!')
+            return None
+        return message_type.decode(_U32.pack(len(body)) + body)
 
 
 class PeerMessage:
@@ -372,6 +465,8 @@ class PeerMessage:
         to the Python's "struct" mobile.
     """
 
+    __slots__ = ()
+
     CHOKE = 0
     UNCHOKE = 1
     INTERESTED = 2
@@ -397,8 +492,10 @@ class PeerMessage:
         """
             Decodes the given BitTorrent message into a instance for the
             implementing type.
+
+            By default the message is assumed to have no payload.
         """
-        pass
+        return cls()
 
 
 class Handshake(PeerMessage):
@@ -419,6 +516,8 @@ class Handshake(PeerMessage):
         Thus length is:
             49 + len(pstr) = 68 bytes long.
     """
+
+    __slots__ = ('info_hash', 'peer_id')
     length = 49 + 19
 
     def __init__(self, info_hash: bytes, peer_id: bytes):
@@ -443,8 +542,7 @@ class Handshake(PeerMessage):
             Encodes this object instance to the raw bytes representing the 
             entire message (ready to be transmitted).
         """
-        return struct.pack(
-            '>B19s8x20s20s',
+        return _HS.pack(
             19,
             b'BitTorrent protocol',
             self.info_hash,
@@ -456,10 +554,10 @@ class Handshake(PeerMessage):
             Decodes the BitTorrent given message into a handshake message, if 
             not a valid message, None is returned.
         """
-        logging.debug(f'Decoding Handshake of length: {len(data)}')
+        logging.debug('Decoding Handshake of length: %d', len(data))
         if len(data) < (49 + 19):
             return None
-        parts = struct.unpack('>B19s8x20s20s', data)
+        parts = _HS.unpack_from(data, 0)
         return cls(info_hash=parts[2], peer_id=parts[3])
 
 
@@ -470,9 +568,19 @@ class KeepAlive(PeerMessage):
         Message format:
             <len=0000>
     """
+
+    __slots__ = ()
+
     def __str__(self):
         return 'KeepAlive'
 
+    def encode(self) -> bytes:
+        """
+            Encode this object instance to the raw bytes representing the
+            entire message (ready to be transmitted).
+        """
+        return KEEPALIVE_WIRE
+
 
 class BitField(PeerMessage):
     """
@@ -483,30 +591,40 @@ class BitField(PeerMessage):
         Message format:
             <len=0001+X><id=5><bitfield>
     """
-    def __init__(self, data):
-        self.bitfield = bitstring.BitArray(bytes=data)
+
+    __slots__ = ('bitfield',)
+
+    def __init__(self, data: bytes):
+        # The raw bytes are kept as is, one bit for each piece. The bitfield
+        # is immutable so it is shared (not copied) with the piece manager.
+        if not isinstance(data, (bytes, memoryview)):
+            data = bytes(data)
+        self.bitfield = data
 
     def __str__(self):
         return "BitField"
 
+    def has_piece(self, index: int) -> bool:
+        """
+            Checks if the peer has the piece with the given index.
+        """
+        return has_piece(self.bitfield, index)
+
     def encode(self) -> bytes:
         """
             Encodes this object instance to the raw bytes representing the
             entire message (ready to be transmitted).
         """
-        bits_length = len(self.bitfield)
-        return struct.pack(f'>Ib{str(bits_length)}s',
-                           1 + bits_length,
-                           PeerMessage.BITFIELD,
-                           self.bitfield)
+        bytes_length = len(self.bitfield)
+        return _HDR.pack(1 + bytes_length,
+                         PeerMessage.BITFIELD) + self.bitfield
 
     @classmethod
     def decode(cls, data: bytes):
-        message_length = struct.unpack('>I', data[:4])[0]
-        logging.debug(f'Decoding BitField of length: {message_length}')
+        message_length = _U32.unpack_from(data, 0)[0]
+        logging.debug('Decoding BitField of length: %d', message_length)
 
-        parts = struct.unpack(f'>Ib{str(message_length - 1)}s', data)
-        return cls(parts[2])
+        return cls(memoryview(data)[5:4 + message_length].toreadonly())
 
 
 class Interested(PeerMessage):
@@ -518,6 +636,9 @@ class Interested(PeerMessage):
         Message format:
             <len=0001><id=2>
     """
+
+    __slots__ = ()
+
     def __str__(self):
         return 'Interested'
 
@@ -526,9 +647,7 @@ class Interested(PeerMessage):
             Encode this object instance to the raw bytes representing the
             entire message (ready to be transmitted).
         """
-        return struct.pack('>Ib',
-                           1,
-                           PeerMessage.INTERESTED)
+        return INTERESTED_WIRE
 
 
 class NotInterested(PeerMessage):
@@ -540,9 +659,19 @@ class NotInterested(PeerMessage):
         Message format:
             <len=0001><id=3>
     """
+
+    __slots__ = ()
+
     def __str__(self):
         return 'NotInterested'
 
+    def encode(self) -> bytes:
+        """
+            Encode this object instance to the raw bytes representing the
+            entire message (ready to be transmitted).
+        """
+        return NOTINTERESTED_WIRE
+
 
 class Choke(PeerMessage):
     """
@@ -552,9 +681,19 @@ class Choke(PeerMessage):
         Message format:
             <len=0001><id=0> 
     """
+
+    __slots__ = ()
+
     def __str__(self):
         return 'Choke'
 
+    def encode(self) -> bytes:
+        """
+            Encode this object instance to the raw bytes representing the
+            entire message (ready to be transmitted).
+        """
+        return CHOKE_WIRE
+
 
 class Unchoke(PeerMessage):
     """
@@ -564,15 +703,28 @@ class Unchoke(PeerMessage):
         Message format:
             <len=0001><id=1>
     """
+
+    __slots__ = ()
+
     def __str__(self):
         return 'Unchoke'
 
+    def encode(self) -> bytes:
+        """
+            Encode this object instance to the raw bytes representing the
+            entire message (ready to be transmitted).
+        """
+        return UNCHOKE_WIRE
+
 
 class Have(PeerMessage):
     """
         Represents a piece successfully downloaded by the remote peer. The
         piece is a zero based index of the torrents pieces.
     """
+
+    __slots__ = ('index',)
+
     def __init__(self, index: int):
         self.index = index
 
@@ -580,15 +732,12 @@ class Have(PeerMessage):
         return "Have"
 
     def encode(self):
-        return struct.pack('>IbI',
-                           5,
-                           PeerMessage.HAVE,
-                           self.index)
+        return _HAVE.pack(5, PeerMessage.HAVE, self.index)
 
     @classmethod
     def decode(cls, data: bytes):
-        logging.debug(f'Decoding Have of length: {len(data)}')
-        index = struct.unpack('>IbI', data)[2]
+        logging.debug('Decoding Have of length: %d', len(data))
+        index = _HAVE.unpack_from(data, 0)[2]
         return cls(index)
 
 
@@ -603,6 +752,9 @@ class Request(PeerMessage):
         Message format:
             <len=0013><id=6><index><begin><length>
     """
+
+    __slots__ = ('index', 'begin', 'length')
+
     def __init__(self, index: int, begin: int, length: int = REQUEST_SIZE):
         """
             Constructs the Request message.
@@ -620,17 +772,16 @@ class Request(PeerMessage):
         return "Request"
 
     def encode(self):
-        return struct.pack('>IbIII',
-                           13,
-                           PeerMessage.REQUEST,
-                           self.index,
-                           self.begin,
-                           self.length)
+        return _REQ.pack(13,
+                         PeerMessage.REQUEST,
+                         self.index,
+                         self.begin,
+                         self.length)
 
     @classmethod
     def decode(cls, data: bytes):
-        logging.debug(f'Decoding Request of length: {len(data)}')
-        parts = struct.unpack('>IbIII', data)
+        logging.debug('Decoding Request of length: %d', len(data))
+        parts = _REQ.unpack_from(data, 0)
         return cls(parts[2], parts[3], parts[4])
 
 
@@ -648,6 +799,8 @@ class Piece(PeerMessage):
             <length prefix><message ID><index><begin><block>
     """
 
+    __slots__ = ('index', 'begin', 'block')
+
     length = 9
 
     def __init__(self, index: int, begin: int, block: bytes):
@@ -657,7 +810,7 @@ class Piece(PeerMessage):
             Params:
                 index: The zero based piece index
                 begin: The zero based offset within a piece.
-                block: The block data.
+                block: The block data (bytes or a memoryview).
         """
         self.index = index
         self.begin = begin
@@ -668,19 +821,20 @@ class Piece(PeerMessage):
 
     def encode(self):
         message_length = Piece.length + len(self.block)
-        return struct.pack(f'>IbII{str(len(self.block))}s',
-                           message_length,
-                           PeerMessage.Piece,
+        return _PIECE.pack(message_length,
+                           PeerMessage.PIECE,
                            self.index,
-                           self.begin,
-                           self.block)
+                           self.begin) + self.block
 
     @classmethod
     def decode(cls, data: bytes):
-        logging.debug(f'Decoding Piece of length: {len(data)}')
-        length = struct.unpack('>I', data[:4])[0]
-        parts = struct.unpack(f'>IbII{str(length - Piece.length)}s')
-        return cls(parts[2], parts[3], parts[4])
+        """
+            Decodes the piece message, the block is a view into the given data
+            (not a copy of it).
+        """
+        logging.debug('Decoding Piece of length: %d', len(data))
+        length, _, index, begin = _PIECE.unpack_from(data, 0)
+        return cls(index, begin, memoryview(data)[13:4 + length])
 
 
 class Cancel(PeerMessage):
@@ -693,6 +847,8 @@ class Cancel(PeerMessage):
             <len=0013><id=8><index><begin><length>
     """
 
+    __slots__ = ('index', 'begin', 'length')
+
     def __init__(self, index, begin, length: int = REQUEST_SIZE):
         self.index = index
         self.begin = begin
@@ -702,15 +858,43 @@ class Cancel(PeerMessage):
         return "Cancel"
 
     def encode(self):
-        return struct.pack('>IbIII',
-                           13,
-                           PeerMessage.CANCEL,
-                           self.index,
-                           self.begin,
-                           self.length)
+        return _REQ.pack(13,
+                         PeerMessage.CANCEL,
+                         self.index,
+                         self.begin,
+                         self.length)
 
     @classmethod
     def decode(cls, data: bytes):
-        logging.debug(f'Decoding cancel of length: {len(data)}')
-        parts = struct.unpack('>IbIII', data)
+        logging.debug('Decoding cancel of length: %d', len(data))
+        parts = _REQ.unpack_from(data, 0)
         return cls(parts[2], parts[3], parts[4])
+
+
+# Maps the message ID to the type of message it identifies
+_MESSAGE_TYPES = {
+    PeerMessage.CHOKE: Choke,
+    PeerMessage.UNCHOKE: Unchoke,
+    PeerMessage.INTERESTED: Interested,
+    PeerMessage.NOTINTERESTED: NotInterested,
+    PeerMessage.HAVE: Have,
+    PeerMessage.BITFIELD: BitField,
+    PeerMessage.REQUEST: Request,
+    PeerMessage.PIECE: Piece,
+    PeerMessage.CANCEL: Cancel,
+}
+
+# The types of messages after which more blocks might be requested, as
+# these either unchoke us, free a slot in the request pipeline or make
+# new pieces available. None of the other messages change that.
+_REQUEST_AFTER = frozenset((Unchoke, Piece, BitField, Have))
+
+# The messages without any payload carry no state, a single instance of each
+# is shared rather than creating one per received message.
+_KEEPALIVE = KeepAlive()
+_NO_PAYLOAD = {
+    PeerMessage.CHOKE: Choke(),
+    PeerMessage.UNCHOKE: Unchoke(),
+    PeerMessage.INTERESTED: Interested(),
+    PeerMessage.NOTINTERESTED: NotInterested(),
+}
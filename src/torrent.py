@@ -1,7 +1,9 @@
 from . import bencoding
 from hashlib import sha1
 from collections import namedtuple
+from functools import cached_property
 from typing import Union
+import mmap
 import os
 
 # Represents the files within the torrent (i.e. the files to write to disk)
@@ -17,11 +19,19 @@ class Torrent:
         self.filename = filename
         self.files: list = []
 
-        with open(self.filename, 'rb') as f:
-            meta_info = f.read()
-            self.meta_info = bencoding.Decoder(meta_info).decode_data()
-            info = bencoding.Encoder(self.meta_info[b'info']).encode_data()
-            self.info_hash = sha1(info).digest()
+        # The file is decoded straight from the page cache rather than
+        # reading it all into memory first.
+        with open(self.filename, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decoder = bencoding.Decoder(data)
+            self.meta_info = decoder.decode_data()
+            # The info hash is taken over the info dict exactly as stored in
+            # the file, re-encoding it could produce different bytes.
+            if decoder.info_span is None:
+                raise RuntimeError(
+                    f'Invalid torrent {self.filename}: no info dictionary')
+            start, end = decoder.info_span
+            self.info_hash = sha1(data[start:end]).digest()
             self._identify_files()
 
     def _identify_files(self):
@@ -69,20 +79,17 @@ class Torrent:
             raise RuntimeError('Multi-file torrents is not supported!')
         return self.files[0].length
 
-    @property
+    @cached_property
     def pieces(self):
         """
-            String representing all pieces SHA1 hashes.
-        """
-        data = self.meta_info[b'info'][b'pieces']
-        pieces = []
-        offset = 0
-        length = len(data)
+            The SHA1 hash of each piece.
 
-        while offset < length:
-            pieces.append(data[offset:offset + 20])
-            offset += 20
-        return pieces
+            The hashes are 20 bytes views into the concatenated hashes from
+            the meta-info, computed once and without copying the hashes.
+        """
+        data = memoryview(self.meta_info[b'info'][b'pieces'])
+        return [data[offset:offset + 20]
+                for offset in range(0, len(data), 20)]
 
     @property
     def output_file(self):
@@ -1,11 +1,44 @@
 from . import bencoding
 import aiohttp
-import random
+import binascii
 import logging
+import os
 import socket
-from struct import unpack
+import struct
 from urllib.parse import urlencode
 
+# Precompiled formats of the (big-endian) port of a peer, and of a peer in
+# the compact peer list (the IPv4 address followed by the port).
+_PORT = struct.Struct('>H')
+_PEER = struct.Struct('>4sH')
+
+# The HTTP session shared by all trackers, keeping the connections to the
+# trackers alive between the announce calls (and between torrents).
+_session = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+        Get the shared HTTP session, creating it on first use (it has to be
+        created from within the running event loop).
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=4,
+                                           keepalive_timeout=300))
+    return _session
+
+
+async def close_session():
+    """
+        Close the HTTP session shared by all trackers, if opened.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
 
 class TrackerResponse:
     """
@@ -22,7 +55,7 @@ class TrackerResponse:
         self.response = response
 
     def __str__(self):
-        peers = ", ".join([x for (x, _) in self.peers])
+        peers = ", ".join([socket.inet_ntoa(x) for (x, _) in self.peers])
         return f"""
                     incomplete: {self.incomplete},
                     complete: {self.complete},
@@ -71,7 +104,7 @@ class TrackerResponse:
     def peers(self):
         """
             A list of tuples for each peer structrured as
-            (ip, port).
+            (ip, port), the ip is the packed 4 byte IPv4 address.
         """
         # The BitTorrent specification specifies two types of responses.
         # One where the peers field is a list of dictionaries and one
@@ -82,10 +115,10 @@ class TrackerResponse:
             raise NotImplementedError()
         else:
             logging.debug('Binary model peers are returned by tracker')
-            peers = [peers[i:i+6] for i in range(0, len(peers), 6)]
 
-        return [(socket.inet_ntoa(p[:4]), Tracker.decode_port(p[:4]))
-                for p in peers]
+        # Each peer is 6 bytes, the IPv4 address followed by the port
+        end = len(peers) - len(peers) % _PEER.size
+        return list(_PEER.iter_unpack(memoryview(peers)[:end]))
 
 
 class Tracker:
@@ -97,8 +130,12 @@ class Tracker:
 
     def __init__(self, torrent):
         self.torrent = torrent
-        self.peer_id = self._calculate_peer_id(self)
-        self.http_client = aiohttp.ClientSession()
+        self.peer_id = Tracker._calculate_peer_id()
+        # Only the transfer statistics (and the event) changes between the
+        # announce calls, the rest of the URL is encoded once.
+        self._announce_prefix = (
+            self.torrent.announce + '?' +
+            urlencode(self._construct_tracker_parameters()))
 
     async def connect(self,
                       first: bool = None,
@@ -117,21 +154,15 @@ class Tracker:
                 uploaded: The total number of bytes uploaded.
                 downloaded: The total number of bytes downloaded.
         """
-        params = {
-            'info_hash': self.torrent.info_hash,
-            'peer_id': self.peer_id,
-            'port': 6889,
+        url = self._announce_prefix + '&' + urlencode({
             'uploaded': uploaded,
             'downloaded': downloaded,
-            'left': self.torrent.total_size - downloaded,
-            'compact': 1}
+            'left': self.torrent.total_size - downloaded})
         if first:
-            params['event'] = 'started'
-
-        url = self.torrent.announce + '?' + urlencode(params)
+            url += '&event=started'
         logging.info('Connecting to tracker at: ' + url)
 
-        async with self.http_client.get(url) as response:
+        async with _get_session().get(url) as response:
             if not response.status == 200:
                 raise ConnectionError(
                     f'Unable to connect to tracker: \
@@ -141,7 +172,11 @@ class Tracker:
             return TrackerResponse(bencoding.Decoder(data).decode_data())
 
     def close(self):
-        self.http_client.close()
+        """
+            Nothing to release per tracker, the HTTP session is shared by
+            all trackers and closed with 'close_session'.
+        """
+        pass
 
     def raise_for_error(self, tracker_response):
         """
@@ -159,32 +194,29 @@ class Tracker:
     def _construct_tracker_parameters(self):
         """
             Constructs the URL parameters used when issuing
-            the announce call to the tracker.
+            the announce call to the tracker which does not
+            change between calls.
         """
         return {
             'info_hash': self.torrent.info_hash,
             'peer_id': self.peer_id,
             'port': 6889,
-            'uploaded': 0,
-            'downloaded': 0,
-            'left': 0,
             'compact': 1}
 
-    def _calculate_peer_id():
+    @staticmethod
+    def _calculate_peer_id() -> bytes:
         """
             Calculate and return a unique peer ID.
 
             The 'peer id' is a 20 byte long identifier.
             This implementation use the Azureus style
-            '-PC1000-<random-characters>'.
+            '-PC0001-<random-characters>'.
         """
-        return '-PC0001-' + ''.join(
-            [str(random.randint(0, 9)) for _ in range(12)]
-        )
+        return b'-PC0001-' + binascii.b2a_hex(os.urandom(6))
 
     @staticmethod
     def decode_port(port):
         """
             Converts a 32-bit packed binary port number to int.
         """
-        return unpack(">H", port)[0]
+        return _PORT.unpack(port)[0]